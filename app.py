@@ -1,14 +1,17 @@
 import os
-import uuid
+import secrets
+import pickle
+import hashlib
+import random
 import time
-from flask import Flask, request, render_template, redirect, url_for, send_file, jsonify, flash
-from werkzeug.utils import secure_filename
-import pandas as pd
 import threading
+from flask import Flask, request, render_template, redirect, url_for, send_from_directory, flash, Response
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-
-# Import our attendance processing functions
-from script import auto_detect_structure, read_attendance_data, calculate_detailed_statistics, create_detailed_pdf_report
+from diskcache import Cache
+import orjson
 
 app = Flask(__name__)
 app.secret_key = 'attendance_analyzer_secret_key_2025'
@@ -16,102 +19,226 @@ app.secret_key = 'attendance_analyzer_secret_key_2025'
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 REPORTS_FOLDER = 'reports'
+STATUS_FOLDER = 'status'
+CACHE_FOLDER = 'cache'
+CACHE_VERSION = 5  # bump when the analysis output changes shape
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
 
 # Create directories if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(REPORTS_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['REPORTS_FOLDER'] = REPORTS_FOLDER
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Store processing status
-processing_status = {}
+# Store processing status in a disk-backed cache shared by the Flask process
+# and the report workers. Entries expire on their own, so abandoned uploads
+# don't accumulate and the status survives reloader/worker restarts.
+processing_status = Cache(STATUS_FOLDER)
+STATUS_TTL = 3600  # seconds
+
+# Uploads are normally removed through /cleanup. Anything older than the
+# status TTL was abandoned and is swept away periodically.
+UPLOAD_MAX_AGE = STATUS_TTL  # seconds
+SWEEP_INTERVAL = 600  # seconds
+
+# Cached analyses are swept too once they haven't been used for a day (a
+# cache hit refreshes the file's modification time)
+CACHE_MAX_AGE = 24 * 3600  # seconds
+
+# /events streams hold a request thread, so each one is capped and the
+# browser reconnects if processing takes longer. At most EVENTS_MAX_STREAMS
+# are open per process at once, leaving the other request threads free for
+# uploads, downloads and /status; extra clients fall back to polling.
+EVENTS_POLL_INTERVAL = 0.25  # seconds
+EVENTS_MAX_DURATION = 60  # seconds
+EVENTS_KEEPALIVE = 2  # seconds; writing lets the server notice closed tabs
+EVENTS_MAX_STREAMS = 4
+EVENTS_SLOTS = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
+REQUEST_THREADS = 16  # waitress request threads
+
+def sweep_old_uploads():
+    """Delete uploads that outlived their processing status and stale cached analyses"""
+    now = time.time()
+    for folder, max_age in ((UPLOAD_FOLDER, UPLOAD_MAX_AGE), (CACHE_FOLDER, CACHE_MAX_AGE)):
+        cutoff = now - max_age
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('.') and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+def run_upload_sweeper():
+    """Background loop that sweeps abandoned uploads and stale cache entries"""
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            sweep_old_uploads()
+        except OSError as e:
+            print(f"⚠️  Upload sweep failed: {e}")
+
+# Report generation is CPU-bound, so it runs in a process pool. Workers are
+# spawned rather than forked: they start lazily from a request thread, and
+# forking a process that runs other threads (sweeper, SSE streams, diskcache
+# connections) can deadlock. Spawned workers re-import this module; only the
+# main process creates the pool and the sweeper.
+def new_executor():
+    return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+EXECUTOR = None
+EXECUTOR_LOCK = threading.Lock()
+if multiprocessing.current_process().name == 'MainProcess':
+    EXECUTOR = new_executor()
+    threading.Thread(target=run_upload_sweeper, daemon=True).start()
+
+def submit_job(fn, *args):
+    """
+    Submit a job to the process pool. A worker that died abruptly (OOM kill,
+    segfault) leaves the pool broken for good, so it is replaced by a fresh
+    one and the job submitted again.
+    """
+    global EXECUTOR
+    with EXECUTOR_LOCK:
+        try:
+            return EXECUTOR.submit(fn, *args)
+        except BrokenProcessPool:
+            print("⚠️  Process pool is broken - starting a new one")
+            EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            EXECUTOR = new_executor()
+            return EXECUTOR.submit(fn, *args)
+
+# Details recorded at upload time that every later status update keeps
+UPLOAD_STATUS_KEYS = ('filename', 'filepath')
+
+def start_status(file_id, status):
+    """Create the processing status entry of a new upload"""
+    processing_status.set(file_id, status, expire=STATUS_TTL)
+
+def set_status(file_id, status):
+    """
+    Publish the processing status for an upload. The read-modify-write runs
+    in one transaction so it can't race /cleanup or another update; an entry
+    that was already cleaned up (or expired) is not recreated.
+    """
+    with processing_status.transact():
+        current = processing_status.get(file_id)
+        if current is None:
+            return
+        upload_details = {key: current[key] for key in UPLOAD_STATUS_KEYS if key in current}
+        processing_status.set(file_id, {**upload_details, **status}, expire=STATUS_TTL)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def get_funny_messages():
-    """Return a list of funny processing messages"""
-    return [
-        "🔍 Hunting for absent students like a detective...",
-        "🧮 Calculating attendance with quantum precision...",
-        "📊 Teaching Excel some manners...",
-        "🎯 Tracking down those mysterious attendance patterns...",
-        "🔬 Analyzing data like a mad scientist...",
-        "📈 Making charts that would make statisticians weep with joy...",
-        "🎨 Painting your data beautiful shades of green and red...",
-        "🚀 Launching attendance rockets to the moon...",
-        "🧙‍♂️ Casting spells on your spreadsheet...",
-        "🎪 Juggling numbers like a circus performer...",
-        "🍳 Cooking up some spicy attendance insights...",
-        "🎵 Making your data dance to the rhythm of analysis...",
-        "🔮 Predicting which students need more coffee...",
-        "🎭 Turning boring numbers into a dramatic performance...",
-        "🏆 Crowning the attendance champions...",
-        "🎨 Creating a masterpiece from your messy data...",
-        "🧩 Solving the puzzle of student participation...",
-        "🎪 Putting on the greatest data show on earth...",
-        "🚀 Preparing for PDF launch sequence...",
-        "✨ Adding magical finishing touches..."
-    ]
-
-def process_attendance_file(file_id, filepath):
-    """Process the attendance file in a separate thread"""
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
+
+# Funny processing messages shown at each pipeline phase
+FUNNY_MESSAGES = (
+    "🔍 Hunting for absent students like a detective...",
+    "🧮 Calculating attendance with quantum precision...",
+    "📊 Teaching Excel some manners...",
+    "🎯 Tracking down those mysterious attendance patterns...",
+    "🔬 Analyzing data like a mad scientist...",
+    "📈 Making charts that would make statisticians weep with joy...",
+    "🎨 Painting your data beautiful shades of green and red...",
+    "🚀 Launching attendance rockets to the moon...",
+    "🧙‍♂️ Casting spells on your spreadsheet...",
+    "🎪 Juggling numbers like a circus performer...",
+    "🍳 Cooking up some spicy attendance insights...",
+    "🎵 Making your data dance to the rhythm of analysis...",
+    "🔮 Predicting which students need more coffee...",
+    "🎭 Turning boring numbers into a dramatic performance...",
+    "🏆 Crowning the attendance champions...",
+    "🎨 Creating a masterpiece from your messy data...",
+    "🧩 Solving the puzzle of student participation...",
+    "🎪 Putting on the greatest data show on earth...",
+    "🚀 Preparing for PDF launch sequence...",
+    "✨ Adding magical finishing touches..."
+)
+
+def load_cached_analysis(cache_path):
+    """
+    Return the cached analysis tuple, or None on a miss. An entry that can't
+    be unpickled (corrupt file, pandas upgrade) counts as a miss and is
+    overwritten by the recomputed analysis.
+    """
     try:
-        messages = get_funny_messages()
-        
-        # Update status with funny messages during processing
-        for i, message in enumerate(messages):
-            processing_status[file_id] = {
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable cache entry {cache_path}: {e}")
+        return None
+    # Keep entries that are still being used away from the sweeper
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+    return cached
+
+def process_attendance_file(file_id, filepath, reports_folder, cache_path):
+    """Process the attendance file in a worker process"""
+    # Imported here so pandas/numpy/reportlab are only loaded by the pool
+    # workers, not by the processes serving requests
+    from script import load_workbook_once, calculate_detailed_statistics, create_detailed_pdf_report
+
+    try:
+        # Identical uploads reuse the analysis of a previous run and go
+        # straight to PDF generation
+        cached = load_cached_analysis(cache_path)
+        if cached is not None:
+            df, classes_held, subject_columns, stats, preamble_rows = cached
+        else:
+            # Progress is only published at real phase transitions. The values
+            # are weighted by typical phase timings (PDF generation dominates).
+            set_status(file_id, {
                 'status': 'processing',
-                'message': message,
-                'progress': int((i + 1) / len(messages) * 90)  # Up to 90%
-            }
-            time.sleep(0.8)  # Dramatic pause for effect
-        
-        # Actual processing starts here
-        processing_status[file_id] = {
-            'status': 'processing',
-            'message': '🔍 Auto-detecting Excel structure...',
-            'progress': 91
-        }
-        
-        header_row, classes_held_row = auto_detect_structure(filepath)
-        
-        processing_status[file_id] = {
-            'status': 'processing',
-            'message': '📊 Reading and processing attendance data...',
-            'progress': 93
-        }
-        
-        df, classes_held, subject_columns = read_attendance_data(filepath)
-        
-        processing_status[file_id] = {
-            'status': 'processing',
-            'message': '🧮 Performing comprehensive statistical analysis...',
-            'progress': 95
-        }
-        
-        stats = calculate_detailed_statistics(df, classes_held, subject_columns)
+                'message': random.choice(FUNNY_MESSAGES),
+                'progress': 10
+            })
+            
+            # Structure detection, data reading and the title banner rows
+            # share a single workbook parse
+            header_row, classes_held_row, df, classes_held, subject_columns, preamble_rows = load_workbook_once(filepath)
+            
+            set_status(file_id, {
+                'status': 'processing',
+                'message': random.choice(FUNNY_MESSAGES),
+                'progress': 50
+            })
+            
+            stats = calculate_detailed_statistics(df, classes_held, subject_columns)
+            
+            # Write to a temporary file first so concurrent workers never
+            # read a half-written cache entry
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((df, classes_held, subject_columns, stats, preamble_rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
         
-        processing_status[file_id] = {
+        set_status(file_id, {
             'status': 'processing',
-            'message': '📄 Generating beautiful PDF report...',
-            'progress': 97
-        }
+            'message': random.choice(FUNNY_MESSAGES),
+            'progress': 55
+        })
         
         # Generate unique output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"attendance_report_{timestamp}_{file_id[:8]}.pdf"
-        output_path = os.path.join(app.config['REPORTS_FOLDER'], output_filename)
+        output_path = os.path.join(reports_folder, output_filename)
         
-        create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_path)
+        create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_path,
+                                   preamble_rows=preamble_rows)
         
-        processing_status[file_id] = {
+        set_status(file_id, {
             'status': 'completed',
             'message': '🎉 Report generated successfully!',
             'progress': 100,
@@ -122,14 +249,23 @@ def process_attendance_file(file_id, filepath):
                 'avg_attendance': f"{stats['avg_attendance']:.1%}",
                 'subjects': subject_columns[:5]  # Show first 5 subjects
             }
-        }
+        })
         
     except Exception as e:
-        processing_status[file_id] = {
+        set_status(file_id, {
             'status': 'error',
             'message': f'❌ Oops! Something went wrong: {str(e)}',
             'progress': 0
-        }
+        })
+
+def report_worker_failure(file_id, future):
+    """Mark the upload as failed if its worker process died before finishing"""
+    if future.cancelled() or future.exception() is not None:
+        set_status(file_id, {
+            'status': 'error',
+            'message': '❌ Oops! The report worker stopped unexpectedly. Please try again.',
+            'progress': 0
+        })
 
 @app.route('/')
 def index():
@@ -147,26 +283,33 @@ def upload_file():
         return redirect(request.url)
     
     if file and allowed_file(file.filename):
-        # Generate unique file ID
-        file_id = str(uuid.uuid4())
-        filename = secure_filename(f"{file_id}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Generate unique file ID. The upload is stored under the ID alone, so
+        # the user-supplied name never reaches the filesystem.
+        file_id = secrets.token_urlsafe(12)
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}.{extension}")
+        # Stream the upload to disk in 1MB blocks rather than buffering it,
+        # hashing the content on the way for the analysis cache
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(1 << 20), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        cache_path = os.path.join(app.config['CACHE_FOLDER'], f"{digest.hexdigest()}_v{CACHE_VERSION}.pkl")
         
-        # Start processing in background
-        processing_thread = threading.Thread(
-            target=process_attendance_file,
-            args=(file_id, filepath)
-        )
-        processing_thread.daemon = True
-        processing_thread.start()
-        
-        # Initialize processing status
-        processing_status[file_id] = {
+        # Initialize processing status before the worker can overwrite it
+        start_status(file_id, {
             'status': 'starting',
             'message': '🚀 Initializing attendance analyzer...',
-            'progress': 0
-        }
+            'progress': 0,
+            'filename': file.filename,
+            'filepath': filepath
+        })
+        
+        # Start processing in background. process_attendance_file records its
+        # own errors, so a failed future means the worker itself died.
+        future = submit_job(process_attendance_file, file_id, filepath, app.config['REPORTS_FOLDER'], cache_path)
+        future.add_done_callback(lambda f: report_worker_failure(file_id, f))
         
         return redirect(url_for('processing', file_id=file_id))
     else:
@@ -177,44 +320,97 @@ def upload_file():
 def processing(file_id):
     return render_template('processing.html', file_id=file_id)
 
-@app.route('/status/<file_id>')
-def get_status(file_id):
+def json_response(data):
+    """JSON response serialized with orjson (much faster than Flask's stdlib encoder)"""
+    return Response(orjson.dumps(data), mimetype='application/json')
+
+def public_status(file_id):
+    """Status entry as exposed to the browser"""
     status = processing_status.get(file_id, {
         'status': 'not_found',
         'message': '❓ File not found',
         'progress': 0
     })
-    return jsonify(status)
+    # The server-side upload path is internal
+    status.pop('filepath', None)
+    return status
+
+@app.route('/status/<file_id>')
+def get_status(file_id):
+    return json_response(public_status(file_id))
+
+@app.route('/events/<file_id>')
+def status_events(file_id):
+    """Stream status changes as Server-Sent Events over one connection"""
+    if not EVENTS_SLOTS.acquire(blocking=False):
+        # 204 tells EventSource not to reconnect; the page then polls /status
+        return Response(status=204)
+    
+    def generate():
+        last = None
+        deadline = time.monotonic() + EVENTS_MAX_DURATION
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            status = public_status(file_id)
+            payload = orjson.dumps(status)
+            if payload != last:
+                yield b'data: ' + payload + b'\n\n'
+                last = payload
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE:
+                # SSE comment line, ignored by EventSource
+                yield b': keepalive\n\n'
+                last_sent = time.monotonic()
+            if status['status'] in ('completed', 'error', 'not_found'):
+                return
+            time.sleep(EVENTS_POLL_INTERVAL)
+        # Give the request thread back; EventSource reconnects by itself
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the stream ends or the client disconnects
+    response.call_on_close(EVENTS_SLOTS.release)
+    return response
 
 @app.route('/download/<filename>')
 def download_report(filename):
-    try:
-        filepath = os.path.join(app.config['REPORTS_FOLDER'], filename)
-        return send_file(filepath, as_attachment=True, download_name=f"AttendanceReport_{datetime.now().strftime('%Y%m%d')}.pdf")
-    except FileNotFoundError:
-        flash('File not found!')
-        return redirect(url_for('index'))
+    # send_from_directory rejects paths outside the reports folder, answers
+    # 404 for missing files and honours If-None-Match / Range requests
+    return send_from_directory(
+        app.config['REPORTS_FOLDER'],
+        filename,
+        as_attachment=True,
+        download_name=f"AttendanceReport_{datetime.now().strftime('%Y%m%d')}.pdf",
+        conditional=True,
+        etag=True,
+        max_age=3600
+    )
 
 @app.route('/cleanup/<file_id>')
 def cleanup_files(file_id):
     """Clean up uploaded files after processing"""
     try:
         # Remove from processing status
-        if file_id in processing_status:
-            del processing_status[file_id]
+        status = processing_status.pop(file_id, {})
         
         # Clean up uploaded file
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            if filename.startswith(file_id):
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                break
+        if 'filepath' in status:
+            try:
+                os.remove(status['filepath'])
+            except FileNotFoundError:
+                pass
         
-        return jsonify({'status': 'cleaned'})
+        return json_response({'status': 'cleaned'})
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)})
+        return json_response({'status': 'error', 'message': str(e)})
 
 if __name__ == '__main__':
     print("🎉 Starting Attendance Analyzer Web App...")
     print("📊 Ready to process your Excel files!")
     print("🌐 Open your browser and go to: http://localhost:5000")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if os.environ.get('FLASK_DEBUG') == '1':
+        # Werkzeug dev server with debugger and reloader, for development only
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=REQUEST_THREADS)
\ No newline at end of file
@@ -9,12 +9,20 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from datetime import datetime
 import os
 import re
+import functools
+import importlib.util
 
 # Configuration
 CONFIG = {
     'attendance_threshold': 0.75,  # 75% attendance threshold
     'page_size': A4,
     'report_title': 'Attendance Report',
+    # Rust-backed reader (python-calamine), much faster than openpyxl; without
+    # it pandas picks its default engine (openpyxl/xlrd)
+    'excel_engine': 'calamine' if importlib.util.find_spec('python_calamine') else None,
+    # reportlab uses its optional C accelerator (rl_accel) when installed and
+    # pure-Python fallbacks otherwise; the report is the same either way
+    'rl_accel': importlib.util.find_spec('_rl_accel') is not None,
     'font_sizes': {
         'title': 18,
         'heading': 14,
@@ -24,49 +32,131 @@ CONFIG = {
     }
 }
 
+# Standard column names, matched by keyword anywhere in the header. Each
+# alternative is a lookahead from the start, so the order (not the position
+# of the keyword) decides: registration number is checked first (more
+# specific), then serial/sl number, student name and percentage/total.
+COLUMN_PATTERN = re.compile(
+    r'(?=.*(?:reg|roll))(?P<reg>)'
+    r'|(?=.*(?:sl|serial))(?P<sl>)'
+    r'|(?=.*(?:student|name))(?P<name>)'
+    r'|(?=.*(?:percentage|total|overall))(?P<pct>)',
+    re.DOTALL
+)
+COLUMN_NAMES = {'reg': 'Reg_No', 'sl': 'Sl_No', 'name': 'Student_Name', 'pct': 'Percentage'}
+
+# Banner rows above the table that name the institution
+INSTITUTION_PATTERN = re.compile(r'UNIVERSITY|COLLEGE|DEPARTMENT', re.IGNORECASE)
+PREAMBLE_ROWS = 5  # top rows searched for the banner
+
+# Rows searched for the header before falling back to the rest of the sheet
+HEADER_SCAN_ROWS = 10
+
 def auto_detect_structure(file_path):
     """
     Auto-detect the structure of the Excel file to handle different formats
     """
     # Read the entire Excel file to analyze structure
-    df_full = pd.read_excel(file_path, header=None)
-    
+    return detect_structure_rows(_load_sheet(file_path))
+
+def _load_sheet(file_path):
+    """
+    Return the raw cells of the first sheet as a read-only 2D object array,
+    parsing the file only if it changed since the last call (only the most
+    recent sheet is kept, so a long-lived process never holds more than one)
+    """
+    file_stat = os.stat(file_path)
+    return _parse_sheet(os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+
+@functools.lru_cache(maxsize=1)
+def _parse_sheet(file_path, mtime_ns, size):
+    # mtime and size are only part of the cache key
+    cells = pd.read_excel(file_path, header=None, engine=CONFIG['excel_engine']).to_numpy(dtype=object)
+    cells.setflags(write=False)
+    return cells
+
+def detect_structure_rows(cells):
+    """
+    Find the header row and the "classes held" row in the raw sheet cells
+    """
     # Find the row with column headers (usually contains "Student", "Name", "Reg", etc.)
     header_row = None
     classes_held_row = None
     
-    for idx, row in df_full.iterrows():
-        row_str = ' '.join([str(cell).lower() for cell in row if pd.notna(cell)])
-        
-        # Look for header indicators
-        if any(keyword in row_str for keyword in ['student', 'name', 'reg', 'sl', 'percentage']):
-            header_row = idx
+    # Look for header indicators. The header is almost always near the top,
+    # so the rows below are only converted to text if the first block has none.
+    for start, end in ((0, HEADER_SCAN_ROWS), (HEADER_SCAN_ROWS, len(cells))):
+        block = _cells_text(cells[start:end])
+        header_hits = _cells_containing(block, ['student', 'name', 'reg', 'sl', 'percentage']).any(axis=1)
+        if header_hits.any():
+            header_row = start + int(np.argmax(header_hits))
             break
     
     # Look for "classes held" row (usually right after headers)
     if header_row is not None:
-        for idx in range(header_row + 1, min(header_row + 5, len(df_full))):
-            row_str = ' '.join([str(cell).lower() for cell in df_full.iloc[idx] if pd.notna(cell)])
-            if 'classes' in row_str or 'held' in row_str or any(str(cell).isdigit() for cell in df_full.iloc[idx] if pd.notna(cell)):
-                classes_held_row = idx
-                break
+        window = _cells_text(cells[header_row + 1:header_row + 5])
+        classes_hits = (_cells_containing(window, ['classes', 'held']) | np.char.isdigit(window)).any(axis=1)
+        if classes_hits.any():
+            classes_held_row = header_row + 1 + int(np.argmax(classes_hits))
     
     return header_row, classes_held_row
 
-def read_attendance_data(file_path):
+def _cells_text(cells):
     """
-    Read attendance data from Excel file with auto-detection of structure
+    Lowercased text of the cells. Missing cells become 'nan'/'none', which
+    contain none of the detection keywords and are not digits.
+    """
+    return np.char.lower(cells.astype(str))
+
+def _cells_containing(text, keywords):
+    """
+    Boolean mask of the cells whose text contains any of the keywords
+    """
+    mask = np.zeros(text.shape, dtype=bool)
+    for keyword in keywords:
+        mask |= np.char.find(text, keyword) >= 0
+    return mask
+
+def load_workbook_once(file_path):
     """
-    # Auto-detect structure
-    header_row, classes_held_row = auto_detect_structure(file_path)
+    Parse the Excel file a single time and return the detected structure,
+    the cleaned attendance data and the title banner rows:
+    (header_row, classes_held_row, df, classes_held, subject_columns, preamble_rows)
+    """
+    cells = _load_sheet(file_path)
+    header_row, classes_held_row = detect_structure_rows(cells)
     
     if header_row is None:
         # Fallback to original method
         header_row = 3
         classes_held_row = 4
     
-    # Read the Excel file with detected header row
-    df = pd.read_excel(file_path, header=header_row)
+    df, classes_held, subject_columns = build_attendance_data(cells, header_row, classes_held_row)
+    # Copied so the banner rows don't keep the whole sheet alive
+    preamble_rows = cells[:PREAMBLE_ROWS].copy()
+    return header_row, classes_held_row, df, classes_held, subject_columns, preamble_rows
+
+def read_attendance_data(file_path):
+    """
+    Read attendance data from Excel file with auto-detection of structure
+    """
+    _, _, df, classes_held, subject_columns, _ = load_workbook_once(file_path)
+    return df, classes_held, subject_columns
+
+def build_attendance_data(cells, header_row, classes_held_row):
+    """
+    Build the cleaned attendance DataFrame from the already loaded sheet cells
+    """
+    # Use the header row as column names, the same way read_excel(header=...) does
+    column_names = []
+    seen_names = {}
+    for i, name in enumerate(cells[header_row]):
+        name = f'Unnamed: {i}' if pd.isna(name) else name
+        count = seen_names.get(name, 0)
+        seen_names[name] = count + 1
+        column_names.append(f'{name}.{count}' if count else name)
+    
+    df = pd.DataFrame(cells[header_row + 1:], columns=column_names).infer_objects()
     
     # Clean column names
     df.columns = [str(col).strip() for col in df.columns]
@@ -74,83 +164,91 @@ def read_attendance_data(file_path):
     # Try to standardize column names (order matters - check specific patterns first)
     column_mapping = {}
     for col in df.columns:
-        col_lower = col.lower()
-        # Check for registration number first (more specific)
-        if any(keyword in col_lower for keyword in ['reg', 'registration', 'roll']):
-            column_mapping[col] = 'Reg_No'
-        # Then check for serial/sl number (avoid conflicts)
-        elif any(keyword in col_lower for keyword in ['sl', 'serial']) and 'reg' not in col_lower:
-            column_mapping[col] = 'Sl_No'
-        # Student name
-        elif any(keyword in col_lower for keyword in ['student', 'name']) and 'reg' not in col_lower:
-            column_mapping[col] = 'Student_Name'
-        # Percentage/total
-        elif any(keyword in col_lower for keyword in ['percentage', 'total', 'overall']):
-            column_mapping[col] = 'Percentage'
+        match = COLUMN_PATTERN.match(col.lower())
+        if match:
+            column_mapping[col] = COLUMN_NAMES[match.lastgroup]
     
     # Apply column mapping
     df = df.rename(columns=column_mapping)
     
-    # Get classes held information
+    # Get classes held information: the counts of the non-ID columns, parsed
+    # like the attendance values (0 when a count can't be read)
     classes_held = {}
     if classes_held_row is not None:
-        classes_row = pd.read_excel(file_path, header=header_row).iloc[classes_held_row - header_row - 1]
-        
-        for col in df.columns:
-            if col not in ['Sl_No', 'Reg_No', 'Student_Name', 'Percentage'] and pd.notna(classes_row.get(col, None)):
-                try:
-                    # Convert to string first to handle any format
-                    val_str = str(classes_row[col]).strip()
-                    # Remove percentage sign if present
-                    val_str = val_str.replace('%', '')
-                    classes_held[col] = int(float(val_str))
-                except (ValueError, TypeError):
-                    classes_held[col] = 0
+        classes_row = df.iloc[classes_held_row - header_row - 1]
+        classes_row = classes_row[classes_row.notna() & ~classes_row.index.isin(['Sl_No', 'Reg_No', 'Student_Name', 'Percentage'])]
+        counts = _coerce_numeric(classes_row)
+        classes_held = {
+            col: int(count) if np.isfinite(count) else 0
+            for col, count in zip(counts.index, counts.to_numpy())
+        }
     
     # Remove classes held row and other non-student rows
-    df_clean = df.copy()
+    # (both steps return a new frame, so df itself is never modified)
+    df_clean = df
     if classes_held_row is not None and classes_held_row - header_row - 1 >= 0:
         df_clean = df_clean.drop(classes_held_row - header_row - 1, errors='ignore')
     
     # Remove rows without student names
-    df_clean = df_clean.dropna(subset=['Student_Name']).reset_index(drop=True)
-    
-    # Identify subject columns (numeric columns that aren't ID columns)
-    subject_columns = []
-    for col in df_clean.columns:
-        if col not in ['Sl_No', 'Reg_No', 'Student_Name', 'Percentage']:
-            # Check if column contains mostly numeric data
-            try:
-                pd.to_numeric(df_clean[col], errors='coerce')
-                subject_columns.append(col)
-            except:
-                pass
-    
-    # Helper function to clean and convert values (handles percentages)
-    def clean_numeric_value(val):
-        """Convert value to numeric, handling percentages and empty values"""
-        if pd.isna(val) or val == '' or str(val).strip() == '':
-            return np.nan
-        try:
-            # Convert to string and clean
-            val_str = str(val).strip()
-            # Check if it's a percentage format
-            if '%' in val_str:
-                # Remove % and convert to decimal (e.g., "75%" -> 75.0)
-                return float(val_str.replace('%', ''))
-            else:
-                # Just convert to float
-                return float(val_str)
-        except (ValueError, TypeError):
-            return np.nan
+    df_clean = df_clean.dropna(subset=['Student_Name'], ignore_index=True)
+    
+    # Identify subject columns: every column that isn't an ID column, even
+    # if it's empty (see EDGE_CASES.md). Values are coerced below, in one
+    # pass. Duplicated names can't be told apart and are skipped.
+    duplicated = df_clean.columns.duplicated(keep=False)
+    subject_columns = [
+        col for col, is_duplicate in zip(df_clean.columns, duplicated)
+        if col not in ['Sl_No', 'Reg_No', 'Student_Name', 'Percentage'] and not is_duplicate
+    ]
     
     # Convert numeric columns, handling percentages and empty values
-    for col in subject_columns + ['Percentage']:
-        if col in df_clean.columns:
-            df_clean[col] = df_clean[col].apply(clean_numeric_value)
+    numeric_columns = [col for col in subject_columns + ['Percentage'] if col in df_clean.columns]
+    df_clean[numeric_columns] = df_clean[numeric_columns].apply(_coerce_numeric)
     
     return df_clean, classes_held, subject_columns
 
+def _coerce_numeric(values):
+    """
+    Convert a column to floats, handling percentages ("75%" -> 75.0) and
+    empty values; anything unparseable becomes NaN
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype(np.float64)
+    cleaned = values.astype(str).str.strip().str.replace('%', '', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce').astype(np.float64)
+
+def attendance_matrix(df, classes_held, subject_columns):
+    """
+    Return attended classes as a (students x subjects) float matrix together
+    with the classes held per subject (0 when unknown)
+    """
+    attended = df[subject_columns].to_numpy(dtype=np.float64)
+    held = np.array([classes_held.get(subject, 0) for subject in subject_columns], dtype=np.float64)
+    return attended, held
+
+def overall_from_subjects(attended, held):
+    """
+    Overall attendance of each student across all subjects that have classes
+    held information, as a fraction (0 when nothing can be counted)
+    """
+    counted = ~np.isnan(attended) & (held > 0)
+    total_attended = np.where(counted, attended, 0).sum(axis=1)
+    total_classes = np.where(counted, held, 0).sum(axis=1)
+    return np.divide(total_attended, total_classes,
+                     out=np.zeros_like(total_attended), where=total_classes > 0)
+
+def _top_indices(values, k):
+    """
+    Indices of the k largest values, largest first; equal values keep their
+    original order
+    """
+    if values.size <= k:
+        candidates = np.arange(values.size)
+    else:
+        kth_largest = np.partition(values, values.size - k)[values.size - k]
+        candidates = np.flatnonzero(values >= kth_largest)
+    return candidates[np.argsort(-values[candidates], kind='stable')][:k]
+
 def calculate_detailed_statistics(df, classes_held, subject_columns):
     """
     Calculate comprehensive statistics including subject-wise analysis for each student
@@ -158,6 +256,11 @@ def calculate_detailed_statistics(df, classes_held, subject_columns):
     stats = {}
     threshold = CONFIG['attendance_threshold']
     
+    # Overall attendance computed from subject data, used whenever the
+    # percentage column is missing, empty or zero for a student
+    attended, held = attendance_matrix(df, classes_held, subject_columns)
+    subject_overall = overall_from_subjects(attended, held)
+    
     # Overall statistics
     stats['total_students'] = len(df)
     
@@ -166,28 +269,26 @@ def calculate_detailed_statistics(df, classes_held, subject_columns):
     percentage_has_data = False
     
     if percentage_column_exists:
-        # Check if the percentage column has any valid data
-        valid_pct_count = df['Percentage'].notna().sum()
-        percentage_has_data = valid_pct_count > 0
+        # Check if the percentage column has any valid data; mean, max and
+        # min are then taken over the valid values only
+        valid_pcts = df['Percentage'].to_numpy(dtype=np.float64)
+        valid_pcts = valid_pcts[~np.isnan(valid_pcts)]
+        percentage_has_data = valid_pcts.size > 0
         
         if percentage_has_data:
-            max_pct = df['Percentage'].max()
+            max_pct = float(valid_pcts.max())
             
             # Only check format if we have valid, non-zero data
-            if pd.notna(max_pct) and max_pct > 0:
+            if max_pct > 0:
                 stats['percentage_calculated'] = False  # Using provided data
-                if max_pct <= 1.0:
-                    # Values are in decimal form (e.g., 0.75), no conversion needed
-                    stats['avg_attendance'] = df['Percentage'].mean()
-                    stats['highest_attendance'] = df['Percentage'].max()
-                    stats['lowest_attendance'] = df['Percentage'].min()
-                    threshold_compare = threshold
-                else:
-                    # Values are in percentage form (e.g., 75), convert for display
-                    stats['avg_attendance'] = df['Percentage'].mean() / 100 if pd.notna(df['Percentage'].mean()) else 0
-                    stats['highest_attendance'] = df['Percentage'].max() / 100 if pd.notna(df['Percentage'].max()) else 0
-                    stats['lowest_attendance'] = df['Percentage'].min() / 100 if pd.notna(df['Percentage'].min()) else 0
-                    threshold_compare = threshold * 100
+                # Values are either in decimal form (e.g., 0.75) or in
+                # percentage form (e.g., 75); stats are shown as decimals and
+                # the threshold is compared on the column's own scale
+                percentage_scale = 1 if max_pct <= 1.0 else 100
+                stats['avg_attendance'] = float(valid_pcts.mean()) / percentage_scale
+                stats['highest_attendance'] = max_pct / percentage_scale
+                stats['lowest_attendance'] = float(valid_pcts.min()) / percentage_scale
+                threshold_compare = threshold * percentage_scale
             else:
                 # All zeros or NaN - treat as no data
                 percentage_has_data = False
@@ -196,36 +297,15 @@ def calculate_detailed_statistics(df, classes_held, subject_columns):
     if not percentage_has_data:
         print("   ℹ️  Overall percentage column is empty or missing - calculating from subject data...")
         
-        # Calculate overall percentage for each student from their subject attendance
-        calculated_percentages = []
-        for _, row in df.iterrows():
-            total_attended = 0
-            total_classes = 0
-            
-            for subject in subject_columns:
-                if subject in row and pd.notna(row[subject]):
-                    attended = row[subject]
-                    classes = classes_held.get(subject, 0)
-                    
-                    if classes > 0:
-                        try:
-                            total_attended += float(attended)
-                            total_classes += classes
-                        except (ValueError, TypeError):
-                            pass
-            
-            if total_classes > 0:
-                calculated_percentages.append(total_attended / total_classes)
-            else:
-                calculated_percentages.append(0)
-        
-        if calculated_percentages and any(p > 0 for p in calculated_percentages):
+        # The overall percentage of each student, calculated from their
+        # subject attendance
+        if subject_overall.size and (subject_overall > 0).any():
             # Add calculated percentage to DataFrame
-            df['Percentage'] = calculated_percentages
+            df['Percentage'] = subject_overall
             
-            stats['avg_attendance'] = sum(calculated_percentages) / len(calculated_percentages)
-            stats['highest_attendance'] = max(calculated_percentages)
-            stats['lowest_attendance'] = min(calculated_percentages)
+            stats['avg_attendance'] = float(subject_overall.mean())
+            stats['highest_attendance'] = float(subject_overall.max())
+            stats['lowest_attendance'] = float(subject_overall.min())
             threshold_compare = threshold
             percentage_has_data = True
             stats['percentage_calculated'] = True  # Flag to indicate calculation
@@ -241,11 +321,13 @@ def calculate_detailed_statistics(df, classes_held, subject_columns):
     
     # Students with attendance >= threshold
     if percentage_has_data and 'Percentage' in df.columns:
-        # Filter out NaN values before comparison
-        valid_percentages = df['Percentage'].dropna()
-        if len(valid_percentages) > 0:
-            stats['students_above_threshold'] = len(valid_percentages[valid_percentages >= threshold_compare])
-            stats['students_below_threshold'] = len(valid_percentages[valid_percentages < threshold_compare])
+        # NaN values count as neither above nor below the threshold
+        percentages = df['Percentage'].to_numpy()
+        valid_count = np.count_nonzero(~np.isnan(percentages))
+        if valid_count > 0:
+            above = np.count_nonzero(percentages >= threshold_compare)
+            stats['students_above_threshold'] = int(above)
+            stats['students_below_threshold'] = int(valid_count - above)
         else:
             stats['students_above_threshold'] = 0
             stats['students_below_threshold'] = stats['total_students']
@@ -253,147 +335,142 @@ def calculate_detailed_statistics(df, classes_held, subject_columns):
         stats['students_above_threshold'] = 0
         stats['students_below_threshold'] = stats['total_students']
     
-    # Subject-wise statistics
-    stats['subject_averages'] = {}
-    stats['subject_attendance_rates'] = {}
+    # Subject-wise statistics: mean attended per subject ignoring NaN values
+    # (0 for subjects without any data)
+    valid_counts = (~np.isnan(attended)).sum(axis=0)
+    subject_means = np.divide(np.nansum(attended, axis=0), valid_counts,
+                              out=np.zeros(len(subject_columns)), where=valid_counts > 0)
     
-    for subject in subject_columns:
-        if subject in df.columns:
-            # Calculate mean, ignoring NaN values
-            subject_mean = df[subject].mean()
-            
-            # Check if the subject has any valid data
-            if pd.notna(subject_mean):
-                stats['subject_averages'][subject] = subject_mean
-                
-                # Calculate attendance rate if classes held info available
-                if subject in classes_held and classes_held[subject] > 0:
-                    stats['subject_attendance_rates'][subject] = (subject_mean / classes_held[subject]) * 100
-                else:
-                    # If no classes held info, assume the values are already percentages
-                    stats['subject_attendance_rates'][subject] = subject_mean
-            else:
-                # No data for this subject
-                stats['subject_averages'][subject] = 0
-                stats['subject_attendance_rates'][subject] = 0
+    # Attendance rate if classes held info available, otherwise assume the
+    # values are already percentages
+    subject_rates = np.divide(subject_means * 100, held, out=subject_means.copy(), where=held > 0)
     
-    # Individual student analysis
+    stats['subject_averages'] = dict(zip(subject_columns, subject_means.tolist()))
+    stats['subject_attendance_rates'] = dict(zip(subject_columns, subject_rates.tolist()))
+    
+    # Individual student analysis. Everything numeric is computed for all
+    # students at once; the loop below only assembles the records.
     stats['student_details'] = []
     
-    for _, row in df.iterrows():
+    names = df['Student_Name'].tolist()
+    reg_values = df['Reg_No'].tolist() if 'Reg_No' in df.columns else [None] * len(df)
+    
+    # Overall percentage as a fraction: the provided value (converted from
+    # percentage form if needed), or the one calculated from subject data
+    # when it's missing or zero
+    if 'Percentage' in df.columns:
+        provided_pct = df['Percentage'].to_numpy(dtype=np.float64)
+    else:
+        provided_pct = np.full(len(df), np.nan)
+    provided_pct = np.where(provided_pct > 1.0, provided_pct / 100, provided_pct)
+    overall_pcts = np.where(np.isnan(provided_pct) | (provided_pct == 0), subject_overall, provided_pct)
+    
+    # Subject percentages: whole classes attended over classes held, or the
+    # value itself (assumed to be a percentage) without classes held info
+    has_value = ~np.isnan(attended)
+    attended_whole = np.trunc(attended)
+    subject_pcts = np.where(
+        held > 0,
+        np.divide(attended_whole, held, out=np.zeros_like(attended), where=held > 0) * 100,
+        attended
+    )
+    subject_good = subject_pcts >= threshold * 100
+    
+    # Students x subjects mask of the subjects below the threshold (False
+    # where the student has no value); main() filters critical students on it
+    stats['below_threshold'] = below_threshold = has_value & ~subject_good
+    meets_threshold = has_value & subject_good
+    
+    # "Subject: 12.3%" labels of every student/subject cell, formatted in one go
+    subject_labels = np.char.add(
+        np.char.add(np.array(subject_columns, dtype=str), ': '),
+        np.char.mod('%.1f%%', subject_pcts)
+    )
+    
+    for i in range(len(df)):
         # Handle registration number properly
-        reg_value = row.get('Reg_No', None)
+        reg_value = reg_values[i]
         if pd.isna(reg_value) or reg_value == '' or str(reg_value).strip() == '':
             reg_no = None  # Don't show if empty or NaN
         else:
             reg_no = str(reg_value).strip()
         
-        # Handle overall percentage
-        overall_pct_value = row.get('Percentage', None)
-        if pd.isna(overall_pct_value) or overall_pct_value == 0:
-            # Calculate from subject data if percentage is missing or zero
-            total_attended = 0
-            total_classes = 0
-            
-            for subject in subject_columns:
-                if subject in row and pd.notna(row[subject]):
-                    attended = row[subject]
-                    classes = classes_held.get(subject, 0)
-                    
-                    if classes > 0:
-                        try:
-                            total_attended += float(attended)
-                            total_classes += classes
-                        except (ValueError, TypeError):
-                            pass
-            
-            if total_classes > 0:
-                overall_pct = total_attended / total_classes
-            else:
-                overall_pct = 0
-        else:
-            # Check if it's in decimal or percentage format
-            overall_pct = float(overall_pct_value)
-            if overall_pct > 1.0:
-                overall_pct = overall_pct / 100  # Convert to decimal
-        
         student_info = {
-            'name': row.get('Student_Name', 'Unknown'),
+            'name': names[i],
             'reg_no': reg_no,
-            'overall_percentage': overall_pct,
+            'overall_percentage': float(overall_pcts[i]),
             'subjects': {},
-            'subjects_below_threshold': [],
-            'strengths': [],
-            'needs_attention': []
+            'subjects_below_threshold': [subject_columns[j] for j in np.flatnonzero(below_threshold[i])],
+            'strengths': subject_labels[i][meets_threshold[i]].tolist(),
+            'needs_attention': subject_labels[i][below_threshold[i]].tolist()
         }
         
         # Subject-wise analysis for each student
-        for subject in subject_columns:
-            if subject in row and pd.notna(row[subject]):
-                attended = row[subject]
-                total_classes = classes_held.get(subject, 0)
-                
-                # Determine if the value is already a percentage or raw attendance
-                if total_classes > 0:
-                    # We have classes held info, so calculate percentage
-                    try:
-                        attended_int = int(float(attended))
-                        percentage = (attended_int / total_classes) * 100
-                        student_info['subjects'][subject] = {
-                            'attended': attended_int,
-                            'total': total_classes,
-                            'percentage': percentage,
-                            'status': 'Good' if percentage >= threshold * 100 else 'Needs Attention'
-                        }
-                    except (ValueError, TypeError):
-                        # Skip if can't convert to int
-                        continue
-                else:
-                    # No classes held info - assume the value is already a percentage
-                    try:
-                        percentage = float(attended)
-                        student_info['subjects'][subject] = {
-                            'attended': 'N/A',
-                            'total': 'N/A',
-                            'percentage': percentage,
-                            'status': 'Good' if percentage >= threshold * 100 else 'Needs Attention'
-                        }
-                    except (ValueError, TypeError):
-                        # Skip if can't convert to float
-                        continue
-                
-                # Add to tracking lists
-                if subject in student_info['subjects']:
-                    percentage = student_info['subjects'][subject]['percentage']
-                    if percentage < threshold * 100:
-                        student_info['subjects_below_threshold'].append(subject)
-                        student_info['needs_attention'].append(f"{subject}: {percentage:.1f}%")
-                    else:
-                        student_info['strengths'].append(f"{subject}: {percentage:.1f}%")
+        for j in np.flatnonzero(has_value[i]):
+            subject = subject_columns[j]
+            percentage = float(subject_pcts[i, j])
+            good = bool(subject_good[i, j])
+            student_info['subjects'][subject] = {
+                'attended': int(attended_whole[i, j]) if held[j] > 0 else 'N/A',
+                'total': classes_held[subject] if held[j] > 0 else 'N/A',
+                'percentage': percentage,
+                'status': 'Good' if good else 'Needs Attention'
+            }
         
         stats['student_details'].append(student_info)
     
-    # Subject-wise performance ranking
+    # Subject-wise performance ranking: top 5 students per subject (ties in
+    # roster order), selected without sorting the whole column
     stats['subject_rankings'] = {}
-    for subject in subject_columns:
-        if subject in df.columns:
-            subject_data = df[['Student_Name', subject]].copy()
-            subject_data = subject_data.dropna()
-            subject_data = subject_data.sort_values(subject, ascending=False)
-            stats['subject_rankings'][subject] = subject_data.head(5).to_dict('records')
+    for j, subject in enumerate(subject_columns):
+        students = np.flatnonzero(has_value[:, j])
+        values = attended[students, j]
+        stats['subject_rankings'][subject] = [
+            {'Student_Name': names[i], subject: float(attended[i, j])}
+            for i in students[_top_indices(values, 5)]
+        ]
     
     return stats
 
-def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_file='attendance_report_detailed.pdf'):
+# Text templates of the PDF report, filled in per student / per report
+STUDENT_HEADER_TEMPLATE = "<b>{name}</b>{reg} - Overall: {pct:.1%}"
+REG_NO_TEMPLATE = " (Reg: {})"
+LEGEND_TEMPLATE = """<b>Color Coding:</b><br/>
+    • <b>Green highlighting:</b> Subject attendance ≥ {threshold:.0f}% (Meeting requirements)<br/>
+    • <b>Pink highlighting:</b> Subject attendance < {threshold:.0f}% (Needs attention)<br/><br/>
+    <b>Performance Status:</b><br/>
+    • <b>Excellent:</b> ≥{threshold:.0f}% attendance<br/>
+    • <b>Good:</b> ≥{good_threshold:.0f}% attendance<br/>
+    • <b>Needs Focus:</b> <{good_threshold:.0f}% attendance<br/><br/>
+    <b>Important Notes:</b><br/>
+    • Overall attendance is calculated based on all subjects combined<br/>
+    • Students requiring immediate attention are those with multiple subjects below threshold<br/>
+    • This report was generated automatically and should be reviewed by academic staff<br/>
+    • Individual subject-wise analysis helps identify specific areas of concern for each student"""
+
+# ReportLab's default cell leading and top/bottom padding, in points. Every
+# report table uses these (only header rows get a larger bottom padding).
+TABLE_LEADING = 12
+TABLE_CELL_PADDING = 3
+
+def _row_heights(rows, header_bottom_padding):
     """
-    Create a comprehensive PDF report with detailed subject-wise analysis
+    Explicit row heights for a table of plain-text cells, so ReportLab doesn't
+    have to measure every cell. They match what it would compute itself.
+    """
+    heights = [
+        TABLE_LEADING * max(str(cell).count('\n') + 1 for cell in row) + 2 * TABLE_CELL_PADDING
+        for row in rows
+    ]
+    heights[0] += header_bottom_padding - TABLE_CELL_PADDING
+    return heights
+
+@functools.cache
+def _report_styles():
+    """
+    Paragraph and table styles of the PDF report. They never change between
+    reports, so they are built once per process.
     """
-    doc = SimpleDocTemplate(output_file, pagesize=CONFIG['page_size'], 
-                           rightMargin=50, leftMargin=50, 
-                           topMargin=72, bottomMargin=18)
-    
-    # Container for the 'Flowable' objects
-    elements = []
     styles = getSampleStyleSheet()
     
     # Define custom styles
@@ -422,18 +499,93 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
         textColor=colors.darkgreen
     )
     
+    return {
+        'normal': styles['Normal'],
+        'title': title_style,
+        'heading': heading_style,
+        'subheading': subheading_style,
+        'summary_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+        'classes_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+        'subject_avg_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightcyan),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+        ]),
+        # Every student table starts with these; rows are colour coded per student
+        'student_table': (
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 8),
+            ('FONTSIZE', (0, 1), (-1, -1), 7),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+        ),
+    }
+
+def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_file='attendance_report_detailed.pdf', preamble_rows=None):
+    """
+    Create a comprehensive PDF report with detailed subject-wise analysis.
+    preamble_rows are the first raw rows of the sheet (see load_workbook_once),
+    used to pick up the institution banner for the title.
+    """
+    doc = SimpleDocTemplate(output_file, pagesize=CONFIG['page_size'], 
+                           rightMargin=50, leftMargin=50, 
+                           topMargin=72, bottomMargin=18)
+    
+    if not CONFIG['rl_accel']:
+        print("   ℹ️  rl_accel not installed - reportlab uses its pure-Python text routines")
+    
+    # Container for the 'Flowable' objects
+    elements = []
+    report_styles = _report_styles()
+    normal_style = report_styles['normal']
+    title_style = report_styles['title']
+    heading_style = report_styles['heading']
+    subheading_style = report_styles['subheading']
+    
+    # Report-wide invariants, looked up once instead of per subject/student
+    threshold_pct = CONFIG['attendance_threshold'] * 100
+    good_threshold_pct = threshold_pct * 0.8
+    subject_names = {subject: subject.replace('_', ' ').title() for subject in subject_columns}
+    good_color, attention_color = colors.lightgreen, colors.lightpink
+    
     # Auto-detect institution and course info from Excel or use defaults
     institution_info = "DETAILED ATTENDANCE ANALYSIS REPORT"
-    try:
-        # Try to extract info from first few rows of original Excel
-        df_full = pd.read_excel(output_file.replace('_detailed.pdf', '.xlsx') if '.xlsx' not in output_file else 'exampleAtt.xlsx', header=None, nrows=5)
-        for _, row in df_full.iterrows():
+    if preamble_rows is not None:
+        # Use the first banner row of the original Excel that names the institution
+        for row in preamble_rows:
             row_text = ' '.join([str(cell) for cell in row if pd.notna(cell)])
-            if len(row_text) > 20 and any(word in row_text.upper() for word in ['UNIVERSITY', 'COLLEGE', 'DEPARTMENT']):
+            if len(row_text) > 20 and INSTITUTION_PATTERN.search(row_text):
                 institution_info = row_text
                 break
-    except:
-        pass
     
     # Title
     title = Paragraph(f"{institution_info}", title_style)
@@ -442,20 +594,19 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
     
     # Report Generation Info
     report_info_text = f"<b>Report Generated:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}<br/>"
-    report_info_text += f"<b>Analysis Threshold:</b> {CONFIG['attendance_threshold']*100:.0f}%"
+    report_info_text += f"<b>Analysis Threshold:</b> {threshold_pct:.0f}%"
     
     # Add note if overall percentage was calculated
     if stats.get('percentage_calculated', False):
         report_info_text += "<br/><b>Note:</b> Overall percentages calculated from subject-wise attendance (no percentage column in source data)"
     
-    report_info = Paragraph(report_info_text, styles['Normal'])
+    report_info = Paragraph(report_info_text, normal_style)
     elements.append(report_info)
     elements.append(Spacer(1, 20))
     
     # Executive Summary
     elements.append(Paragraph("EXECUTIVE SUMMARY", heading_style))
     
-    threshold_pct = CONFIG['attendance_threshold'] * 100
     summary_data = [
         ['Metric', 'Value'],
         ['Total Students Analyzed', str(stats['total_students'])],
@@ -467,17 +618,9 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
         ['Number of Subjects Analyzed', str(len(subject_columns))]
     ]
     
-    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch],
+                          rowHeights=_row_heights(summary_data, header_bottom_padding=12))
+    summary_table.setStyle(report_styles['summary_table'])
     
     elements.append(summary_table)
     elements.append(Spacer(1, 20))
@@ -487,23 +630,15 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
     
     classes_data = [['Subject', 'Classes Held']]
     for subject in subject_columns:
-        subject_name = subject.replace('_', ' ').title()
+        subject_name = subject_names[subject]
         count = classes_held.get(subject, 0)
         # Show N/A if no classes held information available
         classes_str = str(count) if count > 0 else 'N/A (Percentage format)'
         classes_data.append([subject_name, classes_str])
     
-    classes_table = Table(classes_data, colWidths=[2.5*inch, 1.5*inch])
-    classes_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    classes_table = Table(classes_data, colWidths=[2.5*inch, 1.5*inch],
+                          rowHeights=_row_heights(classes_data, header_bottom_padding=12))
+    classes_table.setStyle(report_styles['classes_table'])
     
     elements.append(classes_table)
     elements.append(Spacer(1, 20))
@@ -526,14 +661,14 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
             # Determine performance status
             if attendance_rate >= threshold_pct:
                 status = "Excellent"
-            elif attendance_rate >= threshold_pct * 0.8:
+            elif attendance_rate >= good_threshold_pct:
                 status = "Good"
             elif attendance_rate > 0:
                 status = "Needs Focus"
             else:
                 status = "No Data"
             
-            subject_name = subject.replace('_', ' ').title()
+            subject_name = subject_names[subject]
             subject_avg_data.append([
                 subject_name,
                 f"{avg_attended:.1f}" if avg_attended > 0 else 'N/A',
@@ -542,19 +677,9 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
                 status
             ])
     
-    subject_avg_table = Table(subject_avg_data, colWidths=[1.8*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-    subject_avg_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightcyan),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-    ]))
+    subject_avg_table = Table(subject_avg_data, colWidths=[1.8*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch],
+                              rowHeights=_row_heights(subject_avg_data, header_bottom_padding=12))
+    subject_avg_table.setStyle(report_styles['subject_avg_table'])
     
     elements.append(subject_avg_table)
     elements.append(PageBreak())
@@ -566,6 +691,9 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
     students_per_page = 6
     student_count = 0
     
+    # Layout shared by every student table; only the row colours differ
+    student_col_widths = [1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1.2*inch]
+    
     for student_info in stats['student_details']:
         if student_count > 0 and student_count % students_per_page == 0:
             elements.append(PageBreak())
@@ -576,10 +704,11 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
         overall_pct = student_info.get('overall_percentage', 0)
         
         # Create header text based on whether registration number exists
-        if reg_no and reg_no != 'N/A':
-            header_text = f"<b>{student_name}</b> (Reg: {reg_no}) - Overall: {overall_pct:.1%}"
-        else:
-            header_text = f"<b>{student_name}</b> - Overall: {overall_pct:.1%}"
+        header_text = STUDENT_HEADER_TEMPLATE.format(
+            name=student_name,
+            reg=REG_NO_TEMPLATE.format(reg_no) if reg_no and reg_no != 'N/A' else '',
+            pct=overall_pct
+        )
         
         student_header = Paragraph(
             header_text,
@@ -587,48 +716,35 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
         )
         elements.append(student_header)
         
-        # Subject-wise breakdown for this student
+        # Subject-wise breakdown for this student: rows and their colour
+        # coding are produced in the same pass
         if student_info['subjects']:
             student_subject_data = [['Subject', 'Attended', 'Total', 'Percentage', 'Status']]
+            row_colors = []
             
             for subject, subject_data in student_info['subjects'].items():
-                subject_name = subject.replace('_', ' ').title()
-                status = subject_data['status']
-                
-                # Handle N/A values properly
-                attended_str = str(subject_data['attended']) if subject_data['attended'] != 'N/A' else 'N/A'
-                total_str = str(subject_data['total']) if subject_data['total'] != 'N/A' else 'N/A'
-                
                 student_subject_data.append([
-                    subject_name,
-                    attended_str,
-                    total_str,
+                    subject_names[subject],
+                    str(subject_data['attended']),
+                    str(subject_data['total']),
                     f"{subject_data['percentage']:.1f}%",
-                    status
+                    subject_data['status']
                 ])
+                
+                # Color code based on performance (the status already says
+                # whether the subject meets the threshold)
+                row_colors.append(good_color if subject_data['status'] == 'Good' else attention_color)
             
-            student_table = Table(student_subject_data, colWidths=[1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1.2*inch])
-            
-            # Style the student table
-            student_table_style = [
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 8),
-                ('FONTSIZE', (0, 1), (-1, -1), 7),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-            ]
-            
-            # Color code based on performance
-            for i, (subject, subject_data) in enumerate(student_info['subjects'].items(), 1):
-                if subject_data['percentage'] < CONFIG['attendance_threshold'] * 100:
-                    student_table_style.append(('BACKGROUND', (0, i), (-1, i), colors.lightpink))
-                else:
-                    student_table_style.append(('BACKGROUND', (0, i), (-1, i), colors.lightgreen))
+            # One BACKGROUND command per run of equally coloured rows
+            student_table_style = list(report_styles['student_table'])
+            run_start = 1
+            for row, color in enumerate(row_colors, 1):
+                if row == len(row_colors) or row_colors[row] != color:
+                    student_table_style.append(('BACKGROUND', (0, run_start), (-1, row), color))
+                    run_start = row + 1
             
+            student_table = Table(student_subject_data, colWidths=student_col_widths,
+                                  rowHeights=_row_heights(student_subject_data, header_bottom_padding=8))
             student_table.setStyle(TableStyle(student_table_style))
             elements.append(student_table)
             
@@ -640,7 +756,7 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
                 insights.append(f"<b>Needs Attention:</b> {', '.join(student_info['needs_attention'])}")
             
             if insights:
-                insight_para = Paragraph("<br/>".join(insights), styles['Normal'])
+                insight_para = Paragraph("<br/>".join(insights), normal_style)
                 elements.append(insight_para)
         
         elements.append(Spacer(1, 12))
@@ -650,20 +766,12 @@ def create_detailed_pdf_report(df, classes_held, subject_columns, stats, output_
     elements.append(PageBreak())
     elements.append(Paragraph("REPORT LEGEND & NOTES", heading_style))
     
-    legend_text = f"""<b>Color Coding:</b><br/>
-    • <b>Green highlighting:</b> Subject attendance ≥ {CONFIG['attendance_threshold']*100:.0f}% (Meeting requirements)<br/>
-    • <b>Pink highlighting:</b> Subject attendance < {CONFIG['attendance_threshold']*100:.0f}% (Needs attention)<br/><br/>
-    <b>Performance Status:</b><br/>
-    • <b>Excellent:</b> ≥{CONFIG['attendance_threshold']*100:.0f}% attendance<br/>
-    • <b>Good:</b> ≥{CONFIG['attendance_threshold']*80:.0f}% attendance<br/>
-    • <b>Needs Focus:</b> <{CONFIG['attendance_threshold']*80:.0f}% attendance<br/><br/>
-    <b>Important Notes:</b><br/>
-    • Overall attendance is calculated based on all subjects combined<br/>
-    • Students requiring immediate attention are those with multiple subjects below threshold<br/>
-    • This report was generated automatically and should be reviewed by academic staff<br/>
-    • Individual subject-wise analysis helps identify specific areas of concern for each student"""
+    legend_text = LEGEND_TEMPLATE.format(
+        threshold=threshold_pct,
+        good_threshold=good_threshold_pct
+    )
     
-    note = Paragraph(legend_text, styles['Normal'])
+    note = Paragraph(legend_text, normal_style)
     elements.append(note)
     
     # Build PDF
@@ -679,13 +787,13 @@ def main():
         excel_file = 'exampleAtt.xlsx'
         pdf_output = 'attendance_report_detailed.pdf'
         
+        # Structure detection and data reading share a single workbook parse
         print("🔍 Auto-detecting Excel file structure...")
-        header_row, classes_held_row = auto_detect_structure(excel_file)
+        header_row, classes_held_row, df, classes_held, subject_columns, preamble_rows = load_workbook_once(excel_file)
         print(f"   • Header row detected at: {header_row}")
         print(f"   • Classes held row detected at: {classes_held_row}")
         
         print("📊 Reading and processing attendance data...")
-        df, classes_held, subject_columns = read_attendance_data(excel_file)
         print(f"   • Students found: {len(df)}")
         print(f"   • Subjects detected: {len(subject_columns)} ({', '.join(subject_columns)})")
         
@@ -693,7 +801,8 @@ def main():
         stats = calculate_detailed_statistics(df, classes_held, subject_columns)
         
         print("📄 Generating detailed PDF report with subject-wise analysis...")
-        create_detailed_pdf_report(df, classes_held, subject_columns, stats, pdf_output)
+        create_detailed_pdf_report(df, classes_held, subject_columns, stats, pdf_output,
+                                   preamble_rows=preamble_rows)
         
         # Enhanced reporting
         print(f"\n✅ REPORT GENERATION COMPLETED SUCCESSFULLY!")
@@ -705,6 +814,7 @@ def main():
         print(f"   • Attendance range: {stats['lowest_attendance']:.1%} - {stats['highest_attendance']:.1%}")
         
         threshold_pct = CONFIG['attendance_threshold'] * 100
+        good_threshold_pct = threshold_pct * 0.8
         print(f"\n📈 PERFORMANCE BREAKDOWN:")
         print(f"   • Students meeting {threshold_pct:.0f}% threshold: {stats['students_above_threshold']} ({stats['students_above_threshold']/stats['total_students']:.1%})")
         print(f"   • Students needing attention: {stats['students_below_threshold']} ({stats['students_below_threshold']/stats['total_students']:.1%})")
@@ -723,7 +833,7 @@ def main():
                 # Determine status icon
                 if rate >= threshold_pct:
                     status = "✅"
-                elif rate >= threshold_pct * 0.8:
+                elif rate >= good_threshold_pct:
                     status = "⚠️"
                 elif rate > 0:
                     status = "❌"
@@ -731,10 +841,11 @@ def main():
                     status = "ℹ️"
                 
                 # Format output based on whether we have total classes
+                subject_name = subject.replace('_', ' ').title()
                 if total > 0:
-                    print(f"   {status} {subject.replace('_', ' ').title()}: {rate:.1f}% (Avg: {avg:.1f}/{total})")
+                    print(f"   {status} {subject_name}: {rate:.1f}% (Avg: {avg:.1f}/{total})")
                 else:
-                    print(f"   {status} {subject.replace('_', ' ').title()}: {rate:.1f}%")
+                    print(f"   {status} {subject_name}: {rate:.1f}%")
         
         print(f"\n📄 OUTPUT:")
         print(f"   • Detailed PDF report: {pdf_output}")
@@ -743,7 +854,8 @@ def main():
         print(f"   • Ready for academic review and action planning")
         
         # Identify students needing immediate attention
-        critical_students = [s for s in stats['student_details'] if len(s['subjects_below_threshold']) >= 2]
+        critical_idx = np.flatnonzero(np.count_nonzero(stats['below_threshold'], axis=1) >= 2)
+        critical_students = [stats['student_details'][i] for i in critical_idx]
         if critical_students:
             print(f"\n⚠️  STUDENTS REQUIRING IMMEDIATE ATTENTION:")
             for student in critical_students[:5]:  # Show top 5